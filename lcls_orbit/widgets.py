@@ -1,5 +1,6 @@
 from typing import List, Dict
 import logging
+import warnings
 import numpy as np
 from datetime import datetime
 
@@ -14,8 +15,116 @@ from lume_epics.client.monitors import PVTable, PVScalar
 
 from lcls_orbit import SXR_COLORS, HXR_COLORS, SXR_AREAS, HXR_AREAS
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
 logger = logging.getLogger(__name__)
 
+# use default gray color when no color pv is tracked
+DEFAULT_BAR_COLOR = "#695f5e"
+
+
+def _make_hover(value_column: str) -> HoverTool:
+    """Build the device hover tool for an orbit plot showing the given value column.
+
+    """
+    return HoverTool(
+        tooltips=[
+            ("device", "@device"),
+            ("value", f"@{value_column}"),
+            ("location", "@z{0.0}")
+        ]
+    )
+
+
+def _as_float(value) -> float:
+    """Coerce a polled pv value to float, mapping disconnected (None) pvs to nan.
+
+    """
+    return np.nan if value is None else float(value)
+
+
+def _color_extents(extents: list, n_colors: int) -> np.ndarray:
+    """Build one color map break per palette entry, spanning the passed extents.
+
+    """
+    if extents[0] > extents[1]:
+        raise ValueError("Color map extents must be sorted.")
+
+    return np.linspace(float(extents[0]), float(extents[1]), num=n_colors, dtype=np.float64)
+
+
+def _nearest_break(breaks: np.ndarray, value: float) -> int:
+    """Find the index of the break nearest to value in sorted breaks, preferring the
+    lower break on ties.
+
+    """
+    idx = int(np.searchsorted(breaks, value, side="left"))
+
+    if idx == breaks.size:
+        return idx - 1
+
+    if idx > 0 and value - breaks[idx - 1] <= breaks[idx] - value:
+        return idx - 1
+
+    return idx
+
+
+def _table_pvs(table: TableVariable) -> frozenset:
+    """Identify the (row, pv name) pairs monitored for a table.
+
+    """
+    return frozenset(
+        (row, variable.name)
+        for axis in ("X", "Y")
+        for row, variable in table.table_data[axis].items()
+    )
+
+
+def _reduce_reference_numpy(measurements: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """Average collected measurements per device, ignoring nan. Devices without any
+    valid measurement keep their previous reference.
+
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        mean = np.nanmean(measurements, axis=1)
+
+    return np.where(np.isnan(mean), reference, mean)
+
+
+if njit is not None:
+
+    @njit(parallel=True, cache=True)
+    def _reduce_reference(measurements, reference):
+        """Fused single pass equivalent of _reduce_reference_numpy.
+
+        """
+        n_devices, n_steps = measurements.shape
+        out = np.empty(n_devices)
+
+        for i in prange(n_devices):
+            total = 0.0
+            count = 0
+
+            for j in range(n_steps):
+                value = measurements[i, j]
+                if not np.isnan(value):
+                    total += value
+                    count += 1
+
+            if count > 0:
+                out[i] = total / count
+            else:
+                out[i] = reference[i]
+
+        return out
+
+else:
+    _reduce_reference = _reduce_reference_numpy
+
 
 class OrbitDisplay:
     """Object holding orbit display widgets.
@@ -39,8 +148,6 @@ class OrbitDisplay:
         active_beamline: str = "hxr",
     ):
 
-        # construct z
-        self._z = []
         self._active_beamline = active_beamline
 
         self._sxr_table = sxr_table
@@ -54,53 +161,59 @@ class OrbitDisplay:
         elif self._active_beamline == "hxr": 
             table = self._hxr_table
 
-        for row, value in table.table_data["Z"].items():
-            self._z.append(value)
+        # construct z
+        self._z = np.fromiter(table.table_data["Z"].values(), dtype=np.float64)
+        self._z_min = self._z.min()
+        self._z_max = self._z.max()
+
+        # track devices
+        self._row_order = list(table.rows)
 
+        # monitors are cached by monitored pvs so switching tables reuses open channels
+        self._table_pvs = _table_pvs(table)
         self._monitor = PVTable(table, controller)
+        self._monitors = {self._table_pvs: self._monitor}
         self._controller = controller
 
 
         # validate color inputs
         if color_var is not None:
             self._color_monitor = PVScalar(color_var, controller)
-            if extents is None:
-                raise ValueError("Color map requires passing of extents.")
-            else:
-                self._extents = np.array(extents)
-
             if color_map is None:
                 raise ValueError("Color map not provided.")
             else:
                 self._color_map = color_map
 
+            if extents is None:
+                raise ValueError("Color map requires passing of extents.")
+            else:
+                self._extents = _color_extents(extents, len(self._color_map))
+
         if not bar_width:
-            self._bar_width = (max(self._z) - min(self._z)) / (len(self._z) + 1)
+            self._bar_width = (self._z_max - self._z_min) / (self._z.size + 1)
         else:
             self._bar_width = bar_width
 
-        self._x_source = ColumnDataSource(dict(x=[], y=[], device=[], color=[]))
-        self._y_source = ColumnDataSource(dict(x=[], y=[], device=[], color=[]))
+        # both plots draw from one source so locations and devices are sent once
+        self._source = ColumnDataSource()
+        self._seed_source()
 
-        tooltips_x = [
-            ("device", "@device"),
-            ("value", "@y"),
-            ("location", "@x{0.0}")
-        ]
-        
-        x_hover = HoverTool(tooltips=tooltips_x)
-
-        # set up x plot
-        self.x_plot = figure(
+        common_fig_kwargs = dict(
             y_range=(-1, 1),
-            x_range=(min(self._z) - self._bar_width / 2.0, max(self._z) + self._bar_width / 2.0),
             width=width,
             height=height,
             toolbar_location="right",
+        )
+
+        # set up x plot
+        self.x_plot = figure(
+            x_range=(self._z_min - self._bar_width / 2.0, self._z_max + self._bar_width / 2.0),
             title="X (mm)",
+            **common_fig_kwargs,
         )
-        self.x_plot.vbar(x="x", bottom=0, top="y", width=self._bar_width, source=self._x_source,  color="color")
-        self.x_plot.add_tools(x_hover)
+        # bars share a single color, so it is set on the glyph rather than sent per device
+        self._x_bars = self.x_plot.vbar(x="z", bottom=0, top="x", width=self._bar_width, source=self._source, color=DEFAULT_BAR_COLOR)
+        self.x_plot.add_tools(_make_hover("x"))
         self.x_plot.xgrid.grid_line_color = None
         self.x_plot.ygrid.grid_line_color = None
 
@@ -111,25 +224,20 @@ class OrbitDisplay:
         self.x_plot.xaxis.axis_label = "z (m)"
         self.x_plot.outline_line_color = None
 
-        # set up y plot
-        tooltips_y = [
-            ("device", "@device"),
-            ("value", "@y"),
-            ("location", "@x{0.0}")
-        ]
-
-        y_hover = HoverTool(tooltips=tooltips_y)
+        # zero line, shown when values straddle 0
+        self._x_zero_span = Span(
+            location=0, dimension="width", line_color="black", line_width=2, visible=False
+        )
+        self.x_plot.add_layout(self._x_zero_span)
 
+        # set up y plot
         self.y_plot = figure(
-            y_range=(-1, 1),
             x_range=self.x_plot.x_range,
-            width=width,
-            height=height,
-            toolbar_location="right",
             title="Y (mm)",
+            **common_fig_kwargs,
         )
-        self.y_plot.vbar(x="x", bottom=0, top="y", width=self._bar_width, source=self._y_source, color="color")
-        self.y_plot.add_tools(y_hover)
+        self._y_bars = self.y_plot.vbar(x="z", bottom=0, top="y", width=self._bar_width, source=self._source, color=DEFAULT_BAR_COLOR)
+        self.y_plot.add_tools(_make_hover("y"))
         self.y_plot.xgrid.grid_line_color = None
         self.y_plot.ygrid.grid_line_color = None
 
@@ -140,15 +248,21 @@ class OrbitDisplay:
         self.y_plot.xaxis.axis_label = "z (m)"
         self.y_plot.outline_line_color = None
 
-        # track devices 
-        self._devices = table.rows
+        self._y_zero_span = Span(
+            location=0, dimension="width", line_color="black", line_width=2, visible=False
+        )
+        self.y_plot.add_layout(self._y_zero_span)
 
         # indicator whether collecting reference
         self._collecting_reference = False
 
-        # store reference
-        self._reference_measurements = {"X": {device: [] for device in self._devices}, "Y": {device: [] for device in self._devices}}
-        self._active_reference = {"X": {device: 0 for device in self._devices}, "Y": {device: 0 for device in self._devices}}
+        # how many reference steps to collect
+        self._reference_n = reference_n
+
+        # the reference column cursor restarts at 0 so each collection overwrites the
+        # buffers in place
+        self._ref_write_idx = 0
+        self._allocate_table_buffers()
         self._active_reference_timestamp = None
         self._reference_registry = {"sxr": {}, "hxr": {}}
         self._active_beamline = active_beamline
@@ -167,10 +281,6 @@ class OrbitDisplay:
         self.beamline_selection_dropdown = Dropdown(label="Beamline", button_type="default", menu=menu)
         self.beamline_selection_dropdown.on_click(self._toggle_callback)
 
-        # how many reference steps to collect
-        self._reference_n = reference_n
-        self._reference_count = reference_n
-
         # reference button
         self.reference_button = Button(label="Collect Reference")
         self.reference_button.on_click(self._collect_reference)
@@ -232,119 +342,144 @@ class OrbitDisplay:
         """Assign new table variable.
         
         """
-        self._monitor = PVTable(table, self._controller)
+        table_pvs = _table_pvs(table)
 
-        self._z = []
+        if table_pvs != self._table_pvs:
+            if table_pvs not in self._monitors:
+                self._monitors[table_pvs] = PVTable(table, self._controller)
 
-        # caget_many
-        for row, value in table.table_data["Z"].items():
-            self._z.append(value)
+            self._monitor = self._monitors[table_pvs]
+            self._table_pvs = table_pvs
 
+        self._z = np.fromiter(table.table_data["Z"].values(), dtype=np.float64)
+        self._z_min = self._z.min()
+        self._z_max = self._z.max()
 
-        self._reference_measurements = {"X": {row: [] for row in table.rows}, "Y": {row: [] for row in table.rows}}
-        self._devices =  table.rows
-        self._active_reference = {"X": {device: 0 for device in self._devices}, "Y": {device: 0 for device in self._devices}}
+        self._row_order = list(table.rows)
+        self._allocate_table_buffers()
+        self._seed_source()
 
+    def _allocate_table_buffers(self) -> None:
+        """Allocate the per-device buffers for the active table and zero the reference.
 
-    def update(self) -> None:
         """
-        Callback which updates the plot to reflect updated process variable values or
-        new process variable.
+        n_devices = len(self._row_order)
 
-        """
-        vals = self._monitor.poll()
+        # scratch buffers for polled values, reused across updates
+        self._x_buf = np.empty(n_devices, dtype=np.float64)
+        self._y_buf = np.empty_like(self._x_buf)
 
+        # last drawn values, used to skip unchanged polls
+        self._last_x = np.empty_like(self._x_buf)
+        self._last_y = np.empty_like(self._x_buf)
 
-        if self._color_monitor is not None:
-            color_val = self._color_monitor.poll()
-            idx = (np.abs(self._extents - color_val)).argmin()
-            color = self._color_map[idx]
-            colors = [color for device in vals["X"]]
-
-        else:
-            # use default gray color
-            colors = ["#695f5e" for device in vals["X"] ]
+        # store reference, one row per device and one column per collection step
+        self._reference_measurements = {
+            "X": np.full((n_devices, self._reference_n), np.nan, dtype=np.float64),
+            "Y": np.full((n_devices, self._reference_n), np.nan, dtype=np.float64),
+        }
+        self._active_reference = {"X": np.zeros(n_devices), "Y": np.zeros(n_devices)}
 
+    def _seed_source(self) -> None:
+        """Assign the static location and device columns for the active table. Values
+        are patched in by update.
 
-        # if collecting reference, update values
-        if self._collecting_reference:
-            self._reference_count -= 1
+        """
+        n_devices = len(self._row_order)
+
+        # numeric columns are float64 arrays so they serialize as typed arrays
+        self._source.data = dict(
+            z=self._z,
+            x=np.full(n_devices, np.nan, dtype=np.float64),
+            y=np.full(n_devices, np.nan, dtype=np.float64),
+            device=list(self._row_order),
+        )
 
-            for device in vals["X"]:
-                self._reference_measurements["X"][device].append(vals["X"][device])
-            
-            for device in vals["Y"]:
-                self._reference_measurements["Y"][device].append(vals["Y"][device])
+        # force color and values to be sent on next update
+        self._last_color_idx = None
+        self._last_poll_valid = False
 
-            # check n remaining
-            if self._reference_count == 0:
-                self._collecting_reference=False
+    def update(self) -> None:
+        """
+        Callback which updates the plot to reflect updated process variable values or
+        new process variable.
 
-                for device in self._devices:
-                    x_mean = np.mean([x for x in self._reference_measurements["X"][device] if x != None])
-                    y_mean = np.mean([y for y in self._reference_measurements["Y"][device] if y != None])
+        """
+        vals = self._monitor.poll()
 
-                    if not np.isnan(x_mean):
-                        self._active_reference["X"][device] = x_mean
+        if self._color_monitor is not None:
+            color_val = self._color_monitor.poll()
+            idx = _nearest_break(self._extents, color_val)
 
-                    if not np.isnan(y_mean):
-                        self._active_reference["Y"][device] = y_mean
+            # only send color when the palette entry changes
+            if idx != self._last_color_idx:
+                color = self._color_map[idx]
 
-                # reset
-                for device in self._reference_measurements["X"]:
-                    self._reference_measurements["X"][device] = []
-                
-                for device in self._reference_measurements["Y"]:
-                    self._reference_measurements["Y"][device] = []
+                for bars in (self._x_bars, self._y_bars):
+                    bars.glyph.fill_color = color
+                    bars.glyph.line_color = color
 
+                self._last_color_idx = idx
 
-                # reset button
-                self.reference_button.label = "Collect reference"
-                self.reference_button.disabled = False
-                self._reference_count = 0
+        # disconnected pvs report None, plotted as nan
+        x_vals = vals["X"]
+        y_vals = vals["Y"]
+        x = self._x_buf
+        y = self._y_buf
 
-                # reset
-                self._reference_count = self._reference_n
+        for i, device in enumerate(self._row_order):
+            x[i] = _as_float(x_vals[device])
+            y[i] = _as_float(y_vals[device])
 
+        # monitors only push on change, so skip redrawing unchanged values
+        if (
+            self._last_poll_valid
+            and not self._collecting_reference
+            and np.array_equal(x, self._last_x, equal_nan=True)
+            and np.array_equal(y, self._last_y, equal_nan=True)
+        ):
+            return
 
-        # modify vals w.r.t. reference
-        for device in vals["X"]:
-            if vals["X"][device] is not None:
-                vals["X"][device] = self._active_reference["X"][device] - vals["X"][device]
-        for device in vals["Y"]:
-            if vals["Y"][device] is not None:
-                vals["Y"][device] = self._active_reference["Y"][device] - vals["Y"][device]
+        np.copyto(self._last_x, x)
+        np.copyto(self._last_y, y)
+        self._last_poll_valid = True
 
+        # if collecting reference, update values
+        if self._collecting_reference:
+            self._reference_measurements["X"][:, self._ref_write_idx] = x
+            self._reference_measurements["Y"][:, self._ref_write_idx] = y
+            self._ref_write_idx += 1
 
-        devices = [device for device in vals['X']]
-        x = np.array([vals["X"][device] for device in vals["X"]], dtype=np.float64)
-        y = np.array([vals["Y"][device] for device in vals["Y"]], dtype=np.float64)
+            # check n remaining
+            if self._ref_write_idx == self._reference_n:
+                self._active_reference = {
+                    "X": _reduce_reference(self._reference_measurements["X"], self._active_reference["X"]),
+                    "Y": _reduce_reference(self._reference_measurements["Y"], self._active_reference["Y"]),
+                }
 
-        # add hline if 0 inside
-        if min(x) < 0 < max(x):
-            hline = Span(
-                location=0, dimension="width", line_color="black", line_width=2
-            )
-            self.x_plot.add_layout(hline)
+                self._reset_collection()
 
+        # modify vals w.r.t. reference, in place
+        np.subtract(self._active_reference["X"], x, out=x)
+        np.subtract(self._active_reference["Y"], y, out=y)
 
-        # add hline if 0 inside
-        if min(y) < 0 < max(y):
-            hline = Span(
-                location=0, dimension="width", line_color="black", line_width=2
-            )
-            self.y_plot.add_layout(hline)
+        # show hline if 0 inside, ignoring disconnected pvs
+        self._x_zero_span.visible = bool(np.fmin.reduce(x) < 0 < np.fmax.reduce(x))
+        self._y_zero_span.visible = bool(np.fmin.reduce(y) < 0 < np.fmax.reduce(y))
 
-        self._x_source.data.update({"x": self._z, "y": x, "device": devices, "color": colors})
-        self._y_source.data.update({"x": self._z, "y": y, "device": devices, "color": colors})
+        self._source.patch({"x": [(slice(None), x)], "y": [(slice(None), y)]})
 
     def update_colormap(self, color_var: ScalarVariable, cmap: list, extents: list):
         """Update colormap and assign new PV to track for color intensity. The plots will use 
         extents passed to evaluate the PV value along a continuum and assign a color.
         
         """
+        # validate before changing any state
+        color_extents = _color_extents(extents, len(cmap))
+
         self._color_map = cmap
-        self._extents = np.array(range(extents[0], extents[1], len(self._color_map)))
+        self._last_color_idx = None
+        self._extents = color_extents
         self._color_monitor = PVScalar(color_var, self._controller)
 
     def _collect_reference(self):
@@ -353,9 +488,18 @@ class OrbitDisplay:
         self.reference_button.disabled = True
         self._active_reference_timestamp = datetime.now().strftime("%m/%d/%Y, %H:%M:%S")
 
+    def _reset_collection(self):
+        self._collecting_reference = False
+        self._ref_write_idx = 0
+
+        # reset button
+        self.reference_button.label = "Collect reference"
+        self.reference_button.disabled = False
+
     def _reset_reference(self):
-        self._active_reference = {"X": {device: 0 for device in self._devices}, "Y": {device: 0 for device in self._devices}}
+        self._active_reference = {"X": np.zeros(len(self._row_order)), "Y": np.zeros(len(self._row_order))}
         self._active_reference_timestamp = None
+        self._last_poll_valid = False
 
     def _save_reference(self):
         self._reference_registry[self._active_beamline][self._active_reference_timestamp] = self._active_reference
@@ -364,6 +508,7 @@ class OrbitDisplay:
 
     def _set_reference(self, event):
         self._active_reference = self._reference_registry[self._active_beamline][event.item]
+        self._last_poll_valid = False
 
     def toggle_beamline(self, beamline):
         self._active_beamline = beamline
@@ -384,17 +529,6 @@ class OrbitDisplay:
 
         # reset
         self._active_reference_timestamp = None
-
-        for device in self._reference_measurements["X"]:
-            self._reference_measurements["X"][device] = []
-        
-        for device in self._reference_measurements["Y"]:
-            self._reference_measurements["Y"][device] = []
-
-        self.reference_button.label = "Collect reference"
-        self.reference_button.disabled = False
-        self._reference_count = 0
-
-        self._reference_count = self._reference_n
+        self._reset_collection()
 
 